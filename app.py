@@ -1,16 +1,19 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional, Dict
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 import logging
-from collections import Counter, defaultdict
+import numpy as np
 
 # Import existing modules
-from src.collector import get_all_solana_yields, YieldOpportunity
-from src.processor import YieldDataProcessor
-from src.models import RiskScorer, PortfolioOptimizer
+from src.models import OpportunityIndex
+from src.cache import (
+    cache, get_cached_yields, get_yields_for_max_apy, filter_yields_view, start_background_refresh, stop_background_refresh,
+    OPTIMIZER, DEFAULT_MIN_APY, DEFAULT_MIN_TVL, DEFAULT_LIMIT, DEFAULT_MAX_APY
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -46,7 +49,8 @@ class AnalyticsResponse(BaseModel):
 app = FastAPI(
     title="Solana Yield Farming API",
     description="API for Solana yield farming opportunities and portfolio optimization",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 import os
@@ -60,37 +64,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory cache
-cache = {
-    "yields_data": None,
-    "last_updated": None,
-    "cache_ttl": timedelta(minutes=5)
-}
+@app.on_event("startup")
+async def start_cache_refresh():
+    """Warm the cache and start the background refresh task"""
+    await start_background_refresh()
+
+@app.on_event("shutdown")
+async def stop_cache_refresh():
+    """Stop the background refresh task and upstream client"""
+    await stop_background_refresh()
 
-async def get_cached_yields():
-    """Get yields data with caching"""
-    now = datetime.now()
+def _cache_validators() -> Dict[str, str]:
+    """HTTP cache validators for the current cached data"""
+    validators = {"ETag": cache["etag"]}
+    if cache["last_updated"] is not None:
+        validators["Last-Modified"] = format_datetime(cache["last_updated"].astimezone(timezone.utc), usegmt=True)
+    return validators
+
+def _is_not_modified(request: Request, validators: Dict[str, str]) -> bool:
+    """Check If-None-Match / If-Modified-Since against the cache validators"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(',')]
+        return "*" in tags or validators["ETag"] in tags
     
-    # Check if cache is valid
-    if (cache["yields_data"] is not None and 
-        cache["last_updated"] is not None and
-        now - cache["last_updated"] < cache["cache_ttl"]):
-        logger.info("Returning cached yield data")
-        return cache["yields_data"]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and cache["last_updated"] is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return cache["last_updated"].astimezone(timezone.utc).replace(microsecond=0) <= since
     
-    # Fetch fresh data
-    logger.info("Fetching fresh yield data")
-    try:
-        opportunities = await get_all_solana_yields()
-        cache["yields_data"] = opportunities
-        cache["last_updated"] = now
-        return opportunities
-    except Exception as e:
-        logger.error(f"Failed to fetch yield data: {e}")
-        if cache["yields_data"]:
-            logger.info("Returning stale cache data due to fetch error")
-            return cache["yields_data"]
-        raise HTTPException(status_code=500, detail="Failed to fetch yield data")
+    return False
 
 @app.get("/")
 async def root():
@@ -99,86 +107,66 @@ async def root():
 
 @app.get("/api/yields")
 async def get_yields(
-    min_apy: float = Query(0.1, ge=0.1, description="Minimum APY (in percentage)"),
-    min_tvl: int = Query(10000, ge=0, description="Minimum TVL in USD"),
+    request: Request,
+    response: Response,
+    min_apy: float = Query(DEFAULT_MIN_APY, ge=0.1, description="Minimum APY (in percentage)"),
+    min_tvl: int = Query(DEFAULT_MIN_TVL, ge=0, description="Minimum TVL in USD"),
     categories: Optional[str] = Query(None, description="Comma-separated categories"),
-    limit: int = Query(100, ge=1, le=500, description="Maximum number of results"),
-    max_apy: float = Query(50.0, ge=0.0, le=200.0, description="Maximum APY (in percentage)")
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=500, description="Maximum number of results"),
+    max_apy: float = Query(DEFAULT_MAX_APY, ge=0.0, le=200.0, description="Maximum APY (in percentage)")
 ):
     """Get Solana yield opportunities with filters"""
     try:
         opportunities = await get_cached_yields()
+        validators = _cache_validators()
+        if _is_not_modified(request, validators):
+            return Response(status_code=304, headers=validators)
+        response.headers.update(validators)
+        
         if not opportunities:
             return []
-            
-        processor = YieldDataProcessor(max_apy_threshold=max_apy)
-        processed_data = processor.to_dict_list(opportunities)
-        
-        # Count protocols before filtering
-        all_protocols = set(opp['protocol'] for opp in processed_data)
-        logger.info(f"Total protocols before filtering: {len(all_protocols)}")
         
-        # Apply filters
-        if categories:
-            category_list = [c.strip() for c in categories.split(',')]
-            processed_data = [opp for opp in processed_data if opp['category'] in category_list]
+        # Common no-filter path: the cached list is already sorted by APY
+        if (max_apy == DEFAULT_MAX_APY and not categories and
+                min_apy == DEFAULT_MIN_APY and min_tvl == DEFAULT_MIN_TVL):
+            if limit == DEFAULT_LIMIT:
+                return Response(cache["default_yields_blob"], media_type="application/json", headers=validators)
+            return ORJSONResponse(cache["yields"].payloads[:limit], headers=validators)
         
-        filtered_data = [
-            opp for opp in processed_data
-            if opp['apy'] >= min_apy and opp['tvl'] >= min_tvl
-        ]
-        
-        # Count protocols after filtering
-        filtered_protocols = set(opp['protocol'] for opp in filtered_data)
-        logger.info(f"Total protocols after filtering: {len(filtered_protocols)}")
-        
-        sorted_data = sorted(filtered_data, key=lambda x: x['apy'], reverse=True)[:limit]
-        return sorted_data
+        # Returning a response directly skips FastAPI's jsonable_encoder pass
+        filtered_data = filter_yields_view(get_yields_for_max_apy(max_apy), min_apy, min_tvl, categories, limit)
+        return ORJSONResponse(filtered_data, headers=validators)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/analytics")
-async def get_analytics():
+async def get_analytics(request: Request, response: Response):
     """Get market analytics summary"""
     try:
         opportunities = await get_cached_yields()
+        validators = _cache_validators()
+        if _is_not_modified(request, validators):
+            return Response(status_code=304, headers=validators)
+        response.headers.update(validators)
+        
         if not opportunities:
             return {"error": "No data available"}
-            
-        processor = YieldDataProcessor()
-        # Use the same filtering logic as /api/yields
-        processed_data = processor.to_dict_list(opportunities)
-        
-        # Calculate analytics using processed data
-        total_opportunities = len(processed_data)
-        protocols = set(opp['protocol'] for opp in processed_data)
-        total_protocols = len(protocols)
-        
-        total_tvl = sum(opp['tvl'] for opp in processed_data)
-        average_apy = sum(opp['apy'] for opp in processed_data) / total_opportunities if total_opportunities > 0 else 0
-        
-        categories = Counter(opp['category'] for opp in processed_data)
         
-        # Calculate TVL by protocol
-        protocol_tvl = defaultdict(float)
-        for opp in processed_data:
-            protocol_tvl[opp['protocol']] += opp['tvl']
-        
-        top_protocols = dict(sorted(protocol_tvl.items(), key=lambda x: x[1], reverse=True)[:5])
-        
-        return {
-            "total_opportunities": total_opportunities,
-            "total_protocols": total_protocols,
-            "total_tvl": total_tvl,
-            "average_apy": average_apy,
-            "categories": dict(categories),
-            "top_protocols": top_protocols
-        }
+        # Computed and serialized once per cache refresh with the same filtering as /api/yields
+        return Response(cache["analytics_blob"], media_type="application/json", headers=validators)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _solve_unit_allocations(opp_data: OpportunityIndex, risk_tolerance: str) -> List[Dict]:
+    """Find the optimal allocation of a unit investment"""
+    if not opp_data:
+        raise HTTPException(status_code=400, detail="No valid opportunities available for optimization")
+    
+    # A top-5 merge over the pre-sorted index, cheap enough to run inline
+    return OPTIMIZER.find_optimal_allocation(opp_data, 1.0, risk_tolerance)
+
 @app.post("/api/optimize")
 async def optimize_portfolio(request: OptimizeRequest):
     """Generate optimal portfolio allocation"""
@@ -195,41 +183,28 @@ async def optimize_portfolio(request: OptimizeRequest):
         if not opportunities:
             raise HTTPException(status_code=404, detail="No yield data available for optimization")
         
-        # Calculate risk scores and prepare data
-        risk_scorer = RiskScorer()
-        optimizer = PortfolioOptimizer()
-        
-        opp_data = []
-        for opp in opportunities:
-            try:
-                risk_data = risk_scorer.calculate_risk_score(opp.protocol, opp.tvl, opp.apy)
-                opp_data.append({
-                    'protocol': opp.protocol,
-                    'pair': opp.pair,
-                    'apy': opp.apy,
-                    'tvl': opp.tvl,
-                    'audit_score': opp.risks.get('audit_score', 0.5),
-                    'risk_level': risk_data['risk_level']
-                })
-            except Exception as e:
-                logger.warning(f"Error processing opportunity for optimization {opp.protocol}: {e}")
-                continue
+        # Allocation weights do not depend on the amount, so solve once per
+        # risk tolerance and data epoch for a unit investment and scale
+        key = (cache["epoch"], request.risk_tolerance)
+        unit_allocations = cache["allocations"].get(key)
+        if unit_allocations is None:
+            unit_allocations = _solve_unit_allocations(cache["optimizer_inputs"], request.risk_tolerance)
+            cache["allocations"][key] = unit_allocations
         
-        if not opp_data:
-            raise HTTPException(status_code=400, detail="No valid opportunities available for optimization")
-        
-        # Get optimal allocation
-        allocations = optimizer.find_optimal_allocation(
-            opp_data, request.investment_amount, request.risk_tolerance
-        )
-        
-        if not allocations:
+        if not unit_allocations:
             raise HTTPException(status_code=400, detail="No optimal allocation found for given parameters")
         
+        allocations = [
+            {**a, 'allocation_amount': a['allocation_amount'] * request.investment_amount}
+            for a in unit_allocations
+        ]
+        
         # Calculate summary metrics
-        total_apy = sum(a['allocation_amount'] * a['expected_apy'] for a in allocations) / request.investment_amount
+        amounts = np.fromiter((a['allocation_amount'] for a in allocations), dtype=np.float64, count=len(allocations))
+        apys = np.fromiter((a['expected_apy'] for a in allocations), dtype=np.float64, count=len(allocations))
+        total_apy = float(amounts.dot(apys)) / request.investment_amount
         
-        return {
+        return ORJSONResponse({
             "strategy": {
                 "expected_apy": total_apy,
                 "annual_yield": request.investment_amount * total_apy,
@@ -239,7 +214,7 @@ async def optimize_portfolio(request: OptimizeRequest):
             },
             "allocations": allocations,
             "generated_at": datetime.now().isoformat()
-        }
+        })
         
     except HTTPException:
         raise
@@ -264,7 +239,7 @@ async def health_check():
         }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=503,
             content={
                 "status": "unhealthy",
@@ -275,4 +250,8 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # Each worker keeps its own cache and upstream fetch, so keep the count small
+    uvicorn.run(
+        "app:app", host="0.0.0.0", port=8000,
+        loop="uvloop", http="httptools", workers=int(os.getenv("WEB_CONCURRENCY", "2"))
+    )
\ No newline at end of file
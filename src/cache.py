@@ -0,0 +1,267 @@
+from fastapi import HTTPException
+from typing import List, Optional, Dict
+from datetime import datetime, timedelta
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import httpx
+import logging
+import operator
+import time
+import numpy as np
+import orjson
+
+from .collector import get_all_solana_yields, YieldOpportunity
+from .processor import YieldDataProcessor, OpportunityRow, apy_percent
+from .models import RiskScorer, PortfolioOptimizer, OpportunityIndex
+
+logger = logging.getLogger(__name__)
+
+# Default /api/yields query parameters
+DEFAULT_MIN_APY = 0.1
+DEFAULT_MIN_TVL = 10000
+DEFAULT_LIMIT = 100
+DEFAULT_MAX_APY = 50.0
+
+# In-memory cache
+cache = {
+    "yields_data": None,
+    "yields": None,  # CachedYields processed at DEFAULT_MAX_APY
+    "yields_by_max_apy": {},  # CachedYields for other max_apy thresholds, built on demand
+    "default_yields_blob": None,  # Serialized response for the default /api/yields query
+    "analytics_stats": None,
+    "analytics_blob": None,  # Serialized analytics_stats
+    "optimizer_inputs": OpportunityIndex([]),  # Opportunities with risk levels, indexed for the optimizer
+    "allocations": {},  # Unit-investment allocations keyed by (epoch, risk_tolerance)
+    "epoch": 0,  # Incremented on every refresh
+    "etag": None,  # Hash of the upstream-derived data; workers holding the same data agree on it
+    "last_updated": None,
+    "expires_at": 0.0,  # time.monotonic() deadline for the cached data
+    "cache_ttl": timedelta(minutes=5)
+}
+
+# Most non-default max_apy variants kept per refresh
+MAX_APY_VARIANTS = 16
+
+# Shared stateless service objects
+PROCESSOR = YieldDataProcessor(max_apy_threshold=DEFAULT_MAX_APY)
+RISK_SCORER = RiskScorer()
+OPTIMIZER = PortfolioOptimizer()
+
+# Serializes cache refreshes so concurrent requests share a single upstream fetch
+_refresh_lock = asyncio.Lock()
+
+# Background task refreshing the cache every cache_ttl - REFRESH_MARGIN_SECONDS
+REFRESH_MARGIN_SECONDS = 60
+_refresh_task: Optional[asyncio.Task] = None
+# Shared upstream HTTP client, opened on startup
+_http_client: Optional[httpx.AsyncClient] = None
+
+@dataclass
+class CachedYields:
+    """Processed yields sorted by APY desc, with parallel NumPy columns for filtering"""
+    payloads: List[OpportunityRow]
+    apy: np.ndarray
+    tvl: np.ndarray
+    category_id: np.ndarray
+    protocol_id: np.ndarray
+    category_ids: Dict[str, int]
+    protocol_ids: Dict[str, int]
+    
+    def parse_categories(self, categories: str) -> tuple:
+        """Map a comma-separated categories query to category ids"""
+        names = {c.strip() for c in categories.split(',')}
+        return tuple(self.category_ids[name] for name in names if name in self.category_ids)
+    
+    @classmethod
+    def from_processed(cls, processed_data: List[OpportunityRow]) -> 'CachedYields':
+        """Sort processed yields by APY and build the column arrays"""
+        payloads = sorted(processed_data, key=operator.attrgetter('apy'), reverse=True)
+        category_ids: Dict[str, int] = {}
+        protocol_ids: Dict[str, int] = {}
+        count = len(payloads)
+        return cls(
+            payloads=payloads,
+            apy=np.fromiter((opp.apy for opp in payloads), dtype=np.float64, count=count),
+            tvl=np.fromiter((opp.tvl for opp in payloads), dtype=np.float64, count=count),
+            category_id=np.fromiter(
+                (category_ids.setdefault(opp.category, len(category_ids)) for opp in payloads),
+                dtype=np.int16, count=count
+            ),
+            protocol_id=np.fromiter(
+                (protocol_ids.setdefault(opp.protocol, len(protocol_ids)) for opp in payloads),
+                dtype=np.int32, count=count
+            ),
+            category_ids=category_ids,
+            protocol_ids=protocol_ids
+        )
+
+def _content_etag(opportunities: List[YieldOpportunity]) -> str:
+    """ETag over the upstream-derived fields only, so it is stable across refreshes and workers"""
+    content = orjson.dumps([
+        (opp.pool_id, opp.protocol, opp.pair, opp.apy, opp.tvl, opp.category, opp.audit_score, opp.tokens)
+        for opp in opportunities
+    ])
+    return f'"{hashlib.blake2b(content, digest_size=8).hexdigest()}"'
+
+def _refresh_cache_views(opportunities: List[YieldOpportunity]):
+    """Precompute per-refresh views of the yield data"""
+    processed_data = PROCESSOR.to_rows(opportunities)
+    cache["yields"] = CachedYields.from_processed(processed_data)
+    cache["yields_by_max_apy"] = {}
+    cache["default_yields_blob"] = orjson.dumps(cache["yields"].payloads[:DEFAULT_LIMIT])
+    cache["analytics_stats"] = _compute_analytics(cache["yields"])
+    cache["analytics_blob"] = orjson.dumps(cache["analytics_stats"])
+    cache["optimizer_inputs"] = OpportunityIndex(_build_optimizer_inputs(opportunities))
+    cache["etag"] = _content_etag(opportunities)
+
+def get_yields_for_max_apy(max_apy: float) -> CachedYields:
+    """Get processed yields for a max APY threshold, building and keeping non-default ones"""
+    if max_apy == DEFAULT_MAX_APY:
+        return cache["yields"]
+    
+    variants = cache["yields_by_max_apy"]
+    yields = variants.get(max_apy)
+    if yields is None:
+        processor = YieldDataProcessor(max_apy_threshold=max_apy)
+        yields = CachedYields.from_processed(processor.to_rows(cache["yields_data"]))
+        if len(variants) >= MAX_APY_VARIANTS:
+            del variants[next(iter(variants))]
+        variants[max_apy] = yields
+    return yields
+
+def filter_yields_view(yields: CachedYields, min_apy: float, min_tvl: int,
+                       categories: Optional[str], limit: int) -> List[OpportunityRow]:
+    """Filter cached yields with NumPy masks; rows are already sorted by APY"""
+    logger.info(f"Total protocols before filtering: {len(yields.protocol_ids)}")
+    
+    mask = (yields.apy >= min_apy) & (yields.tvl >= min_tvl)
+    if categories:
+        mask &= np.isin(yields.category_id, yields.parse_categories(categories))
+    
+    indices = np.flatnonzero(mask)
+    logger.info(f"Total protocols after filtering: {len(np.unique(yields.protocol_id[indices]))}")
+    
+    payloads = yields.payloads
+    return [payloads[i] for i in indices[:limit].tolist()]
+
+def _build_optimizer_inputs(opportunities: List[YieldOpportunity]) -> List[Dict]:
+    """Prepare optimizer inputs, scoring the risk level of every opportunity"""
+    count = len(opportunities)
+    apys = apy_percent(np.fromiter((opp.apy for opp in opportunities), dtype=np.float64, count=count))
+    risk_levels = RISK_SCORER.calculate_risk_score_batch(
+        [opp.protocol_lower for opp in opportunities],
+        np.fromiter((opp.tvl for opp in opportunities), dtype=np.float64, count=count),
+        apys
+    )['risk_level']
+    
+    return [
+        {
+            'protocol': opp.protocol,
+            'pair': opp.pair,
+            'apy': apy,
+            'tvl': opp.tvl,
+            'audit_score': opp.audit_score,
+            'risk_level': risk_level
+        }
+        for opp, apy, risk_level in zip(opportunities, apys.tolist(), risk_levels.tolist())
+    ]
+
+def _compute_analytics(yields: CachedYields) -> Dict:
+    """Calculate market analytics from the cached yield columns"""
+    total_opportunities = len(yields.payloads)
+    category_labels = list(yields.category_ids)
+    protocol_labels = list(yields.protocol_ids)
+    
+    category_counts = np.bincount(yields.category_id, minlength=len(category_labels))
+    
+    # Calculate TVL by protocol
+    protocol_tvl = np.bincount(yields.protocol_id, weights=yields.tvl, minlength=len(protocol_labels))
+    top_indices = np.argsort(-protocol_tvl, kind='stable')[:5]
+    
+    return {
+        "total_opportunities": total_opportunities,
+        "total_protocols": len(protocol_labels),
+        "total_tvl": float(yields.tvl.sum()),
+        "average_apy": float(yields.apy.mean()) if total_opportunities > 0 else 0,
+        "categories": dict(zip(category_labels, category_counts.tolist())),
+        "top_protocols": {protocol_labels[i]: float(protocol_tvl[i]) for i in top_indices.tolist()}
+    }
+
+async def _refresh_cache() -> List[YieldOpportunity]:
+    """Fetch fresh yield data and rebuild the cache views; callers hold _refresh_lock"""
+    logger.info("Fetching fresh yield data")
+    opportunities = await get_all_solana_yields(_http_client)
+    # The collector reports fetch errors as an empty list; keep a good snapshot instead
+    if not opportunities and cache["yields_data"]:
+        raise RuntimeError("Upstream fetch returned no opportunities, keeping the cached snapshot")
+    cache["yields_data"] = opportunities
+    cache["last_updated"] = datetime.now()
+    cache["expires_at"] = time.monotonic() + cache["cache_ttl"].total_seconds()
+    cache["epoch"] += 1
+    cache["allocations"] = {}
+    _refresh_cache_views(opportunities)
+    return opportunities
+
+async def _periodic_refresh():
+    """Refresh the cache ahead of expiry so requests never wait on the upstream fetch"""
+    interval = cache["cache_ttl"].total_seconds() - REFRESH_MARGIN_SECONDS
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with _refresh_lock:
+                await _refresh_cache()
+        except Exception as e:
+            logger.error(f"Background cache refresh failed: {e}")
+
+async def start_background_refresh():
+    """Open the shared upstream client, warm the cache and start the background refresh task"""
+    global _refresh_task, _http_client
+    # One pooled client for all upstream fetches keeps the connection alive between refreshes
+    _http_client = httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_keepalive_connections=10))
+    try:
+        async with _refresh_lock:
+            await _refresh_cache()
+    except Exception as e:
+        logger.error(f"Initial cache warm-up failed: {e}")
+    _refresh_task = asyncio.create_task(_periodic_refresh())
+
+async def stop_background_refresh():
+    """Stop the background refresh task and close the shared upstream client"""
+    global _http_client
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def get_cached_yields():
+    """Get yields data with caching"""
+    # Serve the snapshot; while the background task is running it keeps the data
+    # fresh, and a stale snapshot means the upstream is failing and will be retried
+    if cache["yields_data"] is not None and (
+            time.monotonic() < cache["expires_at"] or
+            (_refresh_task is not None and not _refresh_task.done())):
+        logger.info("Returning cached yield data")
+        return cache["yields_data"]
+    
+    # Another request is already refreshing: serve the stale snapshot meanwhile
+    if cache["yields_data"] is not None and _refresh_lock.locked():
+        logger.info("Returning stale cache data while a refresh is in progress")
+        return cache["yields_data"]
+    
+    # Still warming up (or running without the background task): fetch inline
+    async with _refresh_lock:
+        # Another request may have refreshed the cache while we waited for the lock
+        if cache["yields_data"] is not None and time.monotonic() < cache["expires_at"]:
+            logger.info("Returning cached yield data")
+            return cache["yields_data"]
+        
+        try:
+            return await _refresh_cache()
+        except Exception as e:
+            logger.error(f"Failed to fetch yield data: {e}")
+            if cache["yields_data"]:
+                logger.info("Returning stale cache data due to fetch error")
+                return cache["yields_data"]
+            raise HTTPException(status_code=500, detail="Failed to fetch yield data")
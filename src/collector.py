@@ -1,10 +1,15 @@
 import httpx
-from typing import List, Dict, Optional
-from dataclasses import dataclass
+import orjson
+import numpy as np
+from typing import List, Dict, Optional, Tuple
+from dataclasses import dataclass, field
 from datetime import datetime
+from itertools import compress
+import functools
 import logging
+import re
 
-@dataclass
+@dataclass(slots=True)
 class YieldOpportunity:
     protocol: str
     pool_id: str
@@ -16,40 +21,111 @@ class YieldOpportunity:
     risks: Dict
     metadata: Dict
     last_updated: datetime
+    # Derived once at construction for the scoring and processing loops;
+    # callers that already lowercased the protocol can pass protocol_lower
+    protocol_lower: str = field(default='', repr=False, compare=False)
+    audit_score: float = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        if not self.protocol_lower:
+            self.protocol_lower = self.protocol.lower()
+        self.audit_score = float(self.risks.get('audit_score', 0.5))
+
+@dataclass
+class YieldOpportunityArray:
+    """Columnar NumPy view of a batch's TVL, with protocol/category codes"""
+    tvl: np.ndarray
+    protocol_code: np.ndarray
+    category_code: np.ndarray
+    protocols: List[str]
+    categories: List[str]
+    
+    @classmethod
+    def from_list(cls, opportunities: List[YieldOpportunity]) -> 'YieldOpportunityArray':
+        """Build the columns, coding protocols and categories in order of first appearance"""
+        protocol_codes: Dict[str, int] = {}
+        category_codes: Dict[str, int] = {}
+        count = len(opportunities)
+        return cls(
+            tvl=np.fromiter((opp.tvl for opp in opportunities), dtype=np.float64, count=count),
+            protocol_code=np.fromiter(
+                (protocol_codes.setdefault(opp.protocol, len(protocol_codes)) for opp in opportunities),
+                dtype=np.int32, count=count
+            ),
+            category_code=np.fromiter(
+                (category_codes.setdefault(opp.category, len(category_codes)) for opp in opportunities),
+                dtype=np.int16, count=count
+            ),
+            protocols=list(protocol_codes),
+            categories=list(category_codes)
+        )
+
+_SOLANA_PROTOCOLS = frozenset({
+    'raydium', 'orca', 'solend', 'mango', 'port', 'tulip', 'marinade',
+    'lido', 'saber', 'sunny', 'drift', 'zeta', 'friktion', 'quarry',
+    'aldrin', 'cropper', 'meteora', 'lifinity', 'apricot', 'jet',
+    'francium', 'larix', 'marginfi', 'kamino', 'socean', 'jpool', 'jito'
+})
+
+def _substring_pattern(names) -> re.Pattern:
+    """Compile a regex matching any of the names as a substring"""
+    return re.compile('|'.join(map(re.escape, names)))
+
+# Category patterns, checked in priority order
+_CATEGORY_PATTERNS = (
+    ('dex', _substring_pattern(['raydium', 'orca', 'serum', 'aldrin'])),
+    ('lending', _substring_pattern(['solend', 'mango', 'port', 'tulip'])),
+    ('liquid_staking', _substring_pattern(['marinade', 'lido', 'socean', 'jito'])),
+    ('derivatives', _substring_pattern(['drift', 'zeta', 'friktion'])),
+    ('farm', _substring_pattern(['saber', 'sunny', 'quarry'])),
+)
+
+_SOLANA_PROTOCOL_PATTERN = _substring_pattern(sorted(_SOLANA_PROTOCOLS))
+
+_HIGH_AUDIT_PATTERN = _substring_pattern(['orca', 'raydium', 'solend', 'marinade', 'jito'])
+_MEDIUM_AUDIT_PATTERN = _substring_pattern(['mango', 'port', 'drift', 'saber'])
+
+@functools.lru_cache(maxsize=1024)
+def _classify_protocol(protocol_lower: str) -> Tuple[str, float]:
+    """Get (category, audit score) for an already-lowercased protocol name"""
+    category = 'other'
+    for name, pattern in _CATEGORY_PATTERNS:
+        if pattern.search(protocol_lower):
+            category = name
+            break
+    
+    if _HIGH_AUDIT_PATTERN.search(protocol_lower):
+        audit_score = 0.9
+    elif _MEDIUM_AUDIT_PATTERN.search(protocol_lower):
+        audit_score = 0.7
+    else:
+        audit_score = 0.5
+    
+    return category, audit_score
 
 class ComprehensiveSolanaCollector:
     """Single collector for ALL Solana yield opportunities"""
     
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
         self.base_url = 'https://yields.llama.fi/pools'
         self.timeout = 30.0
+        self.client = client  # Shared client; a per-call one is used if not given
         
     async def get_all_solana_yields(self) -> List[YieldOpportunity]:
         """Get ALL Solana yield opportunities"""
         
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                # Get all pools from DeFiLlama
-                response = await client.get(self.base_url)
-                response.raise_for_status()
-                data = response.json()
-                all_pools = data.get('data', [])
-            except httpx.RequestError as e:
-                logging.error(f"Failed to fetch data from DeFiLlama: {e}")
-                return []
-            except httpx.HTTPStatusError as e:
-                logging.error(f"HTTP error from DeFiLlama: {e}")
-                return []
-        
-        # Filter for Solana
-        solana_pools = self._filter_solana_pools(all_pools)
+        if self.client is not None:
+            solana_pools = await self._fetch_solana_pools(self.client)
+        else:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                solana_pools = await self._fetch_solana_pools(client)
+        if solana_pools is None:
+            return []
         
-        # Convert to YieldOpportunity objects
-        opportunities = []
-        for pool in solana_pools:
-            opp = self._create_opportunity(pool)
-            if opp and self._validate_opportunity(opp):
-                opportunities.append(opp)
+        # Validate raw pools first so only survivors become YieldOpportunity objects
+        valid = self._valid_pool_mask(solana_pools)
+        now = datetime.now()  # One timestamp for the whole batch
+        opportunities = [self._create_opportunity(pool, now) for pool in compress(solana_pools, valid.tolist())]
         
         # Remove duplicates and sort
         opportunities = self._deduplicate(opportunities)
@@ -58,28 +134,43 @@ class ComprehensiveSolanaCollector:
         print(f"✓ Collected {len(opportunities)} Solana yield opportunities")
         return opportunities
     
+    async def _fetch_solana_pools(self, client: httpx.AsyncClient) -> Optional[List[Dict]]:
+        """Fetch all pools from DeFiLlama and keep the Solana ones"""
+        try:
+            # Get all pools from DeFiLlama
+            response = await client.get(self.base_url, timeout=self.timeout)
+            response.raise_for_status()
+            
+            # Filter for Solana straight away so the raw body and the
+            # global pool list can be freed before conversion
+            solana_pools = self._filter_solana_pools(
+                orjson.loads(response.content).get('data', [])
+            )
+            del response
+            return solana_pools
+        except httpx.RequestError as e:
+            logging.error(f"Failed to fetch data from DeFiLlama: {e}")
+            return None
+        except httpx.HTTPStatusError as e:
+            logging.error(f"HTTP error from DeFiLlama: {e}")
+            return None
+    
     def _filter_solana_pools(self, pools: List[Dict]) -> List[Dict]:
         """Filter pools for Solana ecosystem"""
         
-        solana_protocols = {
-            'raydium', 'orca', 'solend', 'mango', 'port', 'tulip', 'marinade', 
-            'lido', 'saber', 'sunny', 'drift', 'zeta', 'friktion', 'quarry',
-            'aldrin', 'cropper', 'meteora', 'lifinity', 'apricot', 'jet',
-            'francium', 'larix', 'marginfi', 'kamino', 'socean', 'jpool', 'jito'
-        }
-        
         solana_pools = []
         for pool in pools:
-            chain = pool.get('chain', '').lower()
-            project = pool.get('project', '').lower()
+            if pool.get('chain', '').lower() == 'solana':
+                solana_pools.append(pool)
+                continue
             
-            if (chain == 'solana' or 
-                any(protocol in project for protocol in solana_protocols)):
+            project = pool.get('project', '').lower()
+            if project in _SOLANA_PROTOCOLS or _SOLANA_PROTOCOL_PATTERN.search(project):
                 solana_pools.append(pool)
         
         return solana_pools
     
-    def _create_opportunity(self, pool: Dict) -> Optional[YieldOpportunity]:
+    def _create_opportunity(self, pool: Dict, now: datetime) -> YieldOpportunity:
         """Convert pool data to YieldOpportunity"""
         
         apy = pool.get('apy', 0)
@@ -87,7 +178,8 @@ class ComprehensiveSolanaCollector:
         
        
         protocol = pool.get('project', 'Unknown')
-        category = self._categorize_protocol(protocol, pool.get('symbol', ''))
+        protocol_lower = protocol.lower()
+        category, audit_score = _classify_protocol(protocol_lower)
         
         return YieldOpportunity(
             protocol=protocol,
@@ -99,69 +191,33 @@ class ComprehensiveSolanaCollector:
             tokens=pool.get('underlyingTokens', []),
             risks={
                 'il_risk': pool.get('ilRisk', 'no'),
-                'audit_score': self._get_audit_score(protocol)
+                'audit_score': audit_score
             },
             metadata={
                 'url': pool.get('url', ''),
                 'reward_tokens': pool.get('rewardTokens', [])
             },
-            last_updated=datetime.now()
+            last_updated=now,
+            protocol_lower=protocol_lower
         )
     
-    def _categorize_protocol(self, protocol: str, symbol: str) -> str:
-        """Categorize protocol type"""
-        
-        protocol_lower = protocol.lower()
-        
-        if any(p in protocol_lower for p in ['raydium', 'orca', 'serum', 'aldrin']):
-            return 'dex'
-        elif any(p in protocol_lower for p in ['solend', 'mango', 'port', 'tulip']):
-            return 'lending'
-        elif any(p in protocol_lower for p in ['marinade', 'lido', 'socean', 'jito']):
-            return 'liquid_staking'
-        elif any(p in protocol_lower for p in ['drift', 'zeta', 'friktion']):
-            return 'derivatives'
-        elif any(p in protocol_lower for p in ['saber', 'sunny', 'quarry']):
-            return 'farm'
-        else:
-            return 'other'
-    
-    def _get_audit_score(self, protocol: str) -> float:
-        """Estimate audit score"""
-        high_audit = {'orca', 'raydium', 'solend', 'marinade', 'jito'}
-        medium_audit = {'mango', 'port', 'drift', 'saber'}
-        
-        protocol_lower = protocol.lower()
-        
-        if any(p in protocol_lower for p in high_audit):
-            return 0.9
-        elif any(p in protocol_lower for p in medium_audit):
-            return 0.7
-        else:
-            return 0.5
-    
-    def _validate_opportunity(self, opp: YieldOpportunity) -> bool:
-        """Validate opportunity"""
-        if opp.apy < 0.05 or opp.apy > 1000:  # 0.05% to 1000%
-            return False
-        if opp.tvl < 1000:  # Minimum $1000 TVL
-            return False
-        return True
+    def _valid_pool_mask(self, pools: List[Dict]) -> np.ndarray:
+        """Validate raw pool values, returning a boolean mask"""
+        count = len(pools)
+        apy = np.fromiter((pool.get('apy') or 0 for pool in pools), dtype=np.float64, count=count)
+        tvl = np.fromiter((pool.get('tvlUsd') or 0 for pool in pools), dtype=np.float64, count=count)
+        # 0.05% to 1000% APY, minimum $1000 TVL
+        return (apy >= 0.05) & (apy <= 1000) & (tvl >= 1000)
     
     def _deduplicate(self, opportunities: List[YieldOpportunity]) -> List[YieldOpportunity]:
-        """Remove duplicates"""
-        seen = set()
-        unique = []
-        
+        """Remove duplicates, keeping the first opportunity per (protocol, pair)"""
+        unique = {}
         for opp in opportunities:
-            key = f"{opp.protocol}_{opp.pair}"
-            if key not in seen:
-                seen.add(key)
-                unique.append(opp)
+            unique.setdefault((opp.protocol, opp.pair), opp)
         
-        return unique
+        return list(unique.values())
 
 # Simple interface
-async def get_all_solana_yields() -> List[YieldOpportunity]:
-    collector = ComprehensiveSolanaCollector()
+async def get_all_solana_yields(client: Optional[httpx.AsyncClient] = None) -> List[YieldOpportunity]:
+    collector = ComprehensiveSolanaCollector(client)
     return await collector.get_all_solana_yields()
\ No newline at end of file
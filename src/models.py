@@ -1,31 +1,66 @@
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from itertools import islice
+import functools
+import heapq
+import numpy as np
+
+# Reputation scores for known protocols, keyed by lowercase name
+_PROTOCOL_SCORES = {
+    'raydium': 0.95, 'orca': 0.95, 'solend': 0.9,
+    'marinade': 0.9, 'mango': 0.8, 'port': 0.8,
+    'drift': 0.75, 'saber': 0.75, 'sunny': 0.7
+}
+
+@functools.lru_cache(maxsize=1024)
+def _protocol_score(protocol: str) -> float:
+    """Look up a protocol's reputation score, memoized on the raw name"""
+    return _PROTOCOL_SCORES.get(protocol.lower(), 0.5)
+
+# Lower bounds of the High / Medium / Low risk bands, and the label for each band
+_RISK_LEVEL_BOUNDS = (0.4, 0.6, 0.8)
+_RISK_LEVELS = ("Very High Risk", "High Risk", "Medium Risk", "Low Risk")
+_RISK_LEVEL_ARRAY = np.array(_RISK_LEVELS, dtype=object)
 
 class RiskScorer:
-    """Calculate risk scores for yield opportunities"""
+    """Calculate risk scores for yield opportunities (stateless, safe to share)"""
     
     def calculate_risk_score(self, protocol: str, tvl: float, apy: float) -> Dict:
         """Calculate comprehensive risk score"""
+        scores = self.calculate_risk_score_batch([protocol], [tvl], [apy])
+        breakdown = scores['breakdown']
+        
+        return {
+            'overall': float(scores['overall'][0]),
+            'risk_level': scores['risk_level'][0],
+            'breakdown': {
+                'tvl_score': float(breakdown['tvl_score'][0]),
+                'protocol_score': float(breakdown['protocol_score'][0]),
+                'apy_risk': float(breakdown['apy_risk'][0])
+            }
+        }
+    
+    def calculate_risk_score_batch(self, protocols: Sequence[str], tvls: np.ndarray, apys: np.ndarray) -> Dict:
+        """Calculate risk scores for many opportunities at once"""
         
         # TVL score (higher TVL = lower risk)
-        tvl_score = min(1.0, tvl / 10_000_000)
+        tvls = np.asarray(tvls, dtype=np.float64)
+        tvl_score = np.minimum(1.0, tvls / 10_000_000)
         
         # Protocol score
-        protocol_score = self._get_protocol_score(protocol)
+        protocol_score = np.fromiter(
+            (self._get_protocol_score(p) for p in protocols), dtype=np.float64, count=len(protocols)
+        )
         
         # APY risk (very high APY = higher risk)
-        apy_risk = 1.0 if apy < 0.5 else max(0.3, 1 - (apy - 0.5) / 2)
+        apys = np.asarray(apys, dtype=np.float64)
+        apy_risk = np.where(apys < 0.5, 1.0, np.maximum(0.3, 1 - (apys - 0.5) / 2))
         
         # Overall score
-        weights = {'tvl': 0.3, 'protocol': 0.4, 'apy': 0.3}
-        overall_score = (
-            tvl_score * weights['tvl'] +
-            protocol_score * weights['protocol'] +
-            apy_risk * weights['apy']
-        )
+        overall_score = tvl_score * 0.3 + protocol_score * 0.4 + apy_risk * 0.3
         
         return {
             'overall': overall_score,
-            'risk_level': self._get_risk_level(overall_score),
+            'risk_level': _RISK_LEVEL_ARRAY[np.searchsorted(_RISK_LEVEL_BOUNDS, overall_score, side='right')],
             'breakdown': {
                 'tvl_score': tvl_score,
                 'protocol_score': protocol_score,
@@ -35,65 +70,71 @@ class RiskScorer:
     
     def _get_protocol_score(self, protocol: str) -> float:
         """Score protocol based on reputation"""
-        scores = {
-            'raydium': 0.95, 'orca': 0.95, 'solend': 0.9,
-            'marinade': 0.9, 'mango': 0.8, 'port': 0.8,
-            'drift': 0.75, 'saber': 0.75, 'sunny': 0.7
-        }
-        return scores.get(protocol.lower(), 0.5)
+        return _protocol_score(protocol)
+
+# Risk levels each risk tolerance may allocate to
+_RISK_FILTERS = {
+    "Conservative": frozenset({"Low Risk"}),
+    "Moderate": frozenset({"Low Risk", "Medium Risk"}),
+    "Aggressive": frozenset({"Low Risk", "Medium Risk", "High Risk"})
+}
+
+class OpportunityIndex:
+    """Optimizer inputs grouped by risk level, each group sorted by score (apy * audit score)"""
     
-    def _get_risk_level(self, score: float) -> str:
-        """Convert score to risk level"""
-        if score >= 0.8:
-            return "Low Risk"
-        elif score >= 0.6:
-            return "Medium Risk"
-        elif score >= 0.4:
-            return "High Risk"
-        else:
-            return "Very High Risk"
+    def __init__(self, opportunities: List[Dict]):
+        self._count = len(opportunities)
+        # Entries are (-score, position, opportunity) so ties keep input order
+        by_risk: Dict[Optional[str], List[Tuple[float, int, Dict]]] = {}
+        for i, o in enumerate(opportunities):
+            by_risk.setdefault(o.get('risk_level'), []).append((-(o['apy'] * o.get('audit_score', 0.5)), i, o))
+        for entries in by_risk.values():
+            entries.sort()
+        self._by_risk = by_risk
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def top(self, risk_levels: Iterable[str], k: int) -> List[Tuple[float, int, Dict]]:
+        """Highest-scoring k entries across the given risk levels"""
+        groups = [self._by_risk[level] for level in risk_levels if level in self._by_risk]
+        return list(islice(heapq.merge(*groups), k))
 
 # In models.py
 class PortfolioOptimizer:
-    def find_optimal_allocation(self, opportunities: List[Dict], 
+    """Allocate an investment across opportunities (stateless, safe to share)"""
+    
+    def find_optimal_allocation(self, opportunities: Union[List[Dict], OpportunityIndex], 
                               investment: float, risk_tolerance: str) -> List[Dict]:
         """Find optimal allocation"""
-        risk_filters = {
-            "Conservative": ["Low Risk"],
-            "Moderate": ["Low Risk", "Medium Risk"],
-            "Aggressive": ["Low Risk", "Medium Risk", "High Risk"]
-        }
+        allowed_risks = _RISK_FILTERS.get(risk_tolerance, _RISK_FILTERS["Moderate"])
         
-        allowed_risks = risk_filters.get(risk_tolerance, ["Low Risk", "Medium Risk"])
-        filtered_opps = [o for o in opportunities if o.get('risk_level') in allowed_risks]
+        if isinstance(opportunities, OpportunityIndex):
+            top_entries = opportunities.top(allowed_risks, 5)
+        else:
+            top_entries = heapq.nsmallest(5, (
+                (-(o['apy'] * o.get('audit_score', 0.5)), i, o)
+                for i, o in enumerate(opportunities) if o.get('risk_level') in allowed_risks
+            ))
         
-        if not filtered_opps:
+        if not top_entries:
             return []
         
-        # Calculate weighted score and handle zero case
-        scores = [o['apy'] * o.get('audit_score', 0.5) for o in filtered_opps]
-        total_score = sum(scores) or 1.0  # Avoid division by zero
-        
-        allocations = []
-        for i, opp in enumerate(filtered_opps[:5]):  # Top 5 opportunities
-            weight = (opp['apy'] * opp.get('audit_score', 0.5)) / total_score
-            allocation_amount = investment * weight
-            if allocation_amount > 0:  # Only include if allocation is meaningful
-                allocations.append({
-                    'protocol': opp['protocol'],
-                    'pair': opp['pair'],
-                    'allocation_percentage': weight * 100,
-                    'allocation_amount': allocation_amount,
-                    'expected_apy': opp['apy'],
-                    'risk_level': opp.get('risk_level', 'Medium Risk')
-                })
+        # Top 5 opportunities by score, weighted against their own total
+        top_scores = np.array([-neg_score for neg_score, _, _ in top_entries], dtype=np.float64)
+        norm = float(top_scores.sum()) or 1.0  # Avoid division by zero
+        weights = top_scores / norm
         
-        # Normalize to ensure total allocation matches investment
-        if allocations:
-            total_allocated = sum(a['allocation_amount'] for a in allocations)
-            if total_allocated > 0:
-                for a in allocations:
-                    a['allocation_percentage'] = (a['allocation_amount'] / total_allocated) * 100
-                    a['allocation_amount'] = (a['allocation_amount'] / total_allocated) * investment
-        
-        return allocations
\ No newline at end of file
+        # Only include allocations that are meaningful
+        return [
+            {
+                'protocol': opp['protocol'],
+                'pair': opp['pair'],
+                'allocation_percentage': weight * 100,
+                'allocation_amount': investment * weight,
+                'expected_apy': opp['apy'],
+                'risk_level': opp.get('risk_level', 'Medium Risk')
+            }
+            for (_, _, opp), weight in zip(top_entries, weights.tolist())
+            if investment * weight > 0
+        ]
@@ -1,11 +1,46 @@
-from typing import List, Dict
-from collections import Counter, defaultdict
-from statistics import mean, stdev
-from .collector import YieldOpportunity
+from typing import List, Dict, Tuple
+from dataclasses import dataclass, asdict
+from itertools import compress
+from operator import itemgetter
+import heapq
+import numpy as np
+from .collector import YieldOpportunity, YieldOpportunityArray
 from datetime import datetime
 
+@dataclass(slots=True)
+class OpportunityRow:
+    """Processed opportunity; serializes to the same JSON object as the dict form"""
+    protocol: str
+    pair: str
+    apy: float  # Already in percentage
+    tvl: float
+    category: str
+    audit_score: float
+    pool_id: str
+    tokens: List[str]
+    risk_level: str
+    last_updated: str
+
+def apy_percent(apys: np.ndarray) -> np.ndarray:
+    """Express APYs reported as fractions (below 1) in percentage"""
+    return np.where(apys < 1, apys * 100, apys)
+
+def _outlier_mask(apys: np.ndarray, tvls: np.ndarray, min_apy: float, max_apy: float,
+                  min_tvl: float, k_sigma: float = 1.5) -> np.ndarray:
+    """Mask rows within the APY/TVL thresholds and k_sigma deviations of their mean APY"""
+    basic = (apys >= min_apy) & (apys <= max_apy) & (tvls >= min_tvl)
+    basic_apys = apys[basic]
+    if basic_apys.size < 2:  # No spread to filter on
+        return basic
+    
+    avg = basic_apys.mean()
+    std = basic_apys.std(ddof=1)
+    upper_bound = min(avg + k_sigma * std, max_apy)
+    lower_bound = max(min_apy, avg - k_sigma * std)
+    return basic & (apys >= lower_bound) & (apys <= upper_bound)
+
 class YieldDataProcessor:
-    """Process yield data for analysis without pandas dependency"""
+    """Process yield data for analysis without pandas dependency (no per-call state)"""
     
     def __init__(self, max_apy_threshold: float = 50.0):  # 50% APY max by default
         self.max_apy_threshold = max_apy_threshold
@@ -16,67 +51,37 @@ class YieldDataProcessor:
         """Remove statistical outliers from APY values using multiple criteria"""
         if not opportunities:
             return []
-            
-        # Convert APY to percentage before filtering
-        for opp in opportunities:
-            opp.apy = opp.apy * 100 if opp.apy < 1 else opp.apy
-            
-        # First filter by basic thresholds
-        basic_filtered = [
-            opp for opp in opportunities 
-            if (self.min_apy_threshold <= opp.apy <= self.max_apy_threshold and 
-                opp.tvl >= self.min_tvl_threshold)
-        ]
-        
-        if not basic_filtered:
-            return []
-            
-        # Apply statistical filtering
-        apys = [opp.apy for opp in basic_filtered]
+        return self._filter_outliers(opportunities)[0]
+    
+    def _filter_outliers(self, opportunities: List[YieldOpportunity]) -> Tuple[List[YieldOpportunity], np.ndarray]:
+        """Outlier-filtered opportunities and their APYs in percentage; the inputs are not modified"""
+        count = len(opportunities)
+        apys = apy_percent(np.fromiter((opp.apy for opp in opportunities), dtype=np.float64, count=count))
+        tvls = np.fromiter((opp.tvl for opp in opportunities), dtype=np.float64, count=count)
         
-        try:
-            avg = mean(apys)
-            std = stdev(apys)
-            
-            upper_bound = min(avg + 1.5 * std, self.max_apy_threshold)
-            lower_bound = max(self.min_apy_threshold, avg - 1.5 * std)
-            
-            filtered = [
-                opp for opp in basic_filtered
-                if all([
-                    lower_bound <= opp.apy <= upper_bound,
-                    opp.apy <= self.max_apy_threshold,
-                    opp.apy >= self.min_apy_threshold,
-                    opp.tvl >= self.min_tvl_threshold
-                ])
-            ]
-            
-            return filtered
-            
-        except Exception as e:
-            return basic_filtered
+        # Threshold and statistical filters as one mask over float64 columns
+        mask = _outlier_mask(apys, tvls, self.min_apy_threshold, self.max_apy_threshold, self.min_tvl_threshold)
+        return list(compress(opportunities, mask.tolist())), apys[mask]
 
+    def to_rows(self, opportunities: List[YieldOpportunity]) -> List[OpportunityRow]:
+        """Convert opportunities to compact rows"""
+        return self._rows_from(*self._filter_outliers(opportunities))
+    
+    def _rows_from(self, filtered_opportunities: List[YieldOpportunity], apys: np.ndarray) -> List[OpportunityRow]:
+        """Convert already outlier-filtered opportunities and their percentage APYs to rows"""
+        last_updated = datetime.now().isoformat()  # Format once for the whole batch
+        
+        return [
+            OpportunityRow(
+                opp.protocol, opp.pair, apy, opp.tvl, opp.category, opp.audit_score,
+                opp.pool_id, opp.tokens, self._get_risk_level(opp), last_updated
+            )
+            for opp, apy in zip(filtered_opportunities, apys.tolist())
+        ]
+    
     def to_dict_list(self, opportunities: List[YieldOpportunity]) -> List[Dict]:
         """Convert opportunities to list of dictionaries"""
-        filtered_opportunities = self.remove_outliers(opportunities)
-        
-        data = []
-        for opp in filtered_opportunities:
-            # APY should already be in percentage form from remove_outliers
-            data.append({
-                'protocol': opp.protocol,
-                'pair': opp.pair,
-                'apy': opp.apy,  # Already in percentage
-                'tvl': opp.tvl,
-                'category': opp.category,
-                'audit_score': opp.risks.get('audit_score', 0.5),
-                'pool_id': opp.pool_id,
-                'tokens': opp.tokens,
-                'risk_level': self._get_risk_level(opp),
-                'last_updated': datetime.now().isoformat()
-            })
-        
-        return data
+        return [asdict(row) for row in self.to_rows(opportunities)]
     
     def get_summary_stats(self, opportunities: List[YieldOpportunity]) -> Dict:
         """Get summary statistics without pandas"""
@@ -85,48 +90,46 @@ class YieldDataProcessor:
             return {'error': 'No opportunities'}
         
         # Remove outliers before processing
-        filtered_opportunities = self.remove_outliers(opportunities)
-        data = self.to_dict_list(filtered_opportunities)
+        data, apys = self._filter_outliers(opportunities)
         
         if not data:
             return {'error': 'No valid opportunities after filtering'}
         
         # Basic calculations
-        total_opportunities = len(filtered_opportunities)
-        protocols = set(opp['protocol'] for opp in data)
-        total_protocols = len(protocols)
+        total_opportunities = len(data)
         
-        # TVL and APY calculations
-        total_tvl = sum(opp['tvl'] for opp in data)
-        average_apy = sum(opp['apy'] for opp in data) / len(data) if data else 0
+        # Aggregate over NumPy columns rather than per-object attributes
+        columns = YieldOpportunityArray.from_list(data)
+        total_protocols = len(columns.protocols)
+        total_tvl = float(columns.tvl.sum())
+        average_apy = float(apys.mean())
         
         # Category distribution
-        categories = Counter(opp['category'] for opp in data)
+        category_counts = np.bincount(columns.category_code, minlength=len(columns.categories))
+        categories = dict(zip(columns.categories, category_counts.tolist()))
         
         # Top protocols by TVL
-        protocol_tvl = defaultdict(float)
-        for opp in data:
-            protocol_tvl[opp['protocol']] += opp['tvl']
-        
-        top_protocols = dict(
-            sorted(protocol_tvl.items(), key=lambda x: x[1], reverse=True)[:5]
-        )
+        protocol_tvl = np.bincount(columns.protocol_code, weights=columns.tvl, minlength=total_protocols)
+        top_protocols = dict(heapq.nlargest(
+            5, zip(columns.protocols, protocol_tvl.tolist()), key=itemgetter(1)
+        ))
         
         return {
             'total_opportunities': total_opportunities,
             'total_protocols': total_protocols,
             'total_tvl': total_tvl,
             'average_apy': average_apy,
-            'categories': dict(categories),
+            'categories': categories,
             'top_protocols': top_protocols,
             'filtered_count': len(opportunities) - total_opportunities  # Number of filtered outliers
         }
 
     def _get_risk_level(self, opportunity: YieldOpportunity) -> str:
         """Determine risk level based on opportunity characteristics"""
-        if opportunity.risks.get('audit_score', 0.5) >= 0.9:
+        audit_score = opportunity.audit_score
+        if audit_score >= 0.9:
             return 'Low'
-        elif opportunity.risks.get('audit_score', 0.5) >= 0.7:
+        elif audit_score >= 0.7:
             return 'Medium'
         else:
             return 'High'
@@ -136,8 +139,5 @@ class YieldDataProcessor:
         if not opportunities:
             return []
             
-        # Remove outliers
-        filtered_opps = self.remove_outliers(opportunities)
-        
-        # Convert to dictionary format
-        return self.to_dict_list(filtered_opps)
\ No newline at end of file
+        # Remove outliers once, then convert to dictionary format
+        return self.to_dict_list(opportunities)
\ No newline at end of file